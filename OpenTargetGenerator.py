@@ -40,18 +40,70 @@ Long term TODO:
 
 import sys
 import os
-import xml.etree.ElementTree as ET
-from fgmsHandler import FgmsHandler
-from aircraft import Aircraft
+import asyncio
+from math import radians
+try:
+    # lxml parses large scenario files considerably faster when available.
+    import lxml.etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+from fgmsHandler import FgmsHandler, send_batch
+from fgms import read_stopwatch
+from aircraft import Aircraft, update_interval
+from fleet import Fleet
 import constants as c
 
 
+def _as_int(value):
+    """Parse a command value as an int, returning None if it is not a number."""
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _parse_wp(wp):
+    """Parse a navaid element into a (lat, lon, alt, lat_rad, lon_rad) tuple."""
+    lat = float(wp.get('lat'))
+    lon = float(wp.get('lon'))
+    return lat, lon, int(wp.get('alt', 0)), radians(lat), radians(lon)
+
+
 class OpenTargetGenerator:
     def __init__(self):
         print('OpenTargetGenerator v' + c.version + '\n')
-        self.aircraft_list = []
+        self.fleet = Fleet()
         self.prompts()
-        self.super_commands()
+        asyncio.run(self.run())
+
+
+    async def run(self):
+        """Run the fleet update scheduler and the command prompt concurrently.
+
+        A single event loop replaces the per-aircraft handshaker threads:
+        one tick_all task updates and sends out every aircraft, while the
+        blocking command prompt runs in an executor thread.
+        """
+        loop = asyncio.get_running_loop()
+        self.ticker = asyncio.ensure_future(self.tick_all())
+        await loop.run_in_executor(None, self.super_commands)
+
+
+    async def tick_all(self):
+        """Advance every aircraft and send out the positions each update interval."""
+        while True:
+            batch = []
+            tick_time = read_stopwatch()  # one timestamp for the whole batch
+            for ac in self.fleet:
+                if ac.handler is None:
+                    continue
+                ac.control_aircraft()
+                if ac.handler is not None:  # the tick may have deleted the aircraft
+                    packet = ac.handler.build_packet(tick_time)
+                    if packet is not None:
+                        batch.append((ac.handler.socket, packet))
+            send_batch(batch)
+            await asyncio.sleep(update_interval)
 
 
     def prompts(self):
@@ -79,24 +131,27 @@ class OpenTargetGenerator:
 
     def get_data(self):
         c.scenario = ET.parse(os.path.join(c.scenario_path, c.filename)).getroot()
-        c.data['magvar'] = round(float(c.scenario.get('magvar')))
-        c.data['navaids'] = c.scenario.find('navaids').findall('wp')
-        c.data['runways'] = c.scenario.find('runways').findall('rwy')
-        c.data['aircraft'] = c.scenario.find('aircraft').findall('ac')
+        c.magvar = round(float(c.scenario.get('magvar')))
+        c.navaids = c.scenario.find('navaids').findall('wp')
+        c.runways = c.scenario.find('runways').findall('rwy')
+        c.aircraft = c.scenario.find('aircraft').findall('ac')
+        # Index navaids and runways so lookups are O(1) and coordinates
+        # are parsed once instead of on every target change.
+        c.navaids_by_name = {wp.get('name'): _parse_wp(wp) for wp in c.navaids}
+        c.runways_by_id = {rwy.get('id'): (float(rwy.get('lat')), float(rwy.get('lon')),
+                                           int(rwy.get('crs')), int(rwy.get('elev')))
+                           for rwy in c.runways}
 
 
     def initialize_aircraft(self):
-        for ac_data in c.data['aircraft']:
+        for ac_data in c.aircraft:
             aircraft_obj = Aircraft(ac_data)
-            self.aircraft_list.append(aircraft_obj)
+            self.fleet.add(aircraft_obj)
             aircraft_obj.handler = FgmsHandler(aircraft_obj)
 
 
     def delete_all_aircraft(self):
-        for ac in self.aircraft_list:
-            ac.disconnect_aircraft()
-            del ac
-        self.aircraft_list.clear()
+        self.fleet.clear()
 
 
     def super_commands(self):
@@ -106,64 +161,68 @@ class OpenTargetGenerator:
 
             if self.check_global_commands(super_command): continue
 
-            aircraft_found = False
-        
-            for ac in self.aircraft_list:
-                if ac.callsign.find(super_command) != -1:
-                    # Ensure only a single callsign match has been found
-                    if aircraft_found:
-                        aircraft_found = False
-                        break
-                    else:
-                        selected_aircraft = ac
-                        aircraft_found = True
-
-            if aircraft_found: self.aircraft_commands(selected_aircraft)
+            selected_aircraft = self.fleet.find(super_command)
+
+            if selected_aircraft is not None: self.aircraft_commands(selected_aircraft)
             else: print('Aircraft not found')
 
 
     def aircraft_commands(self, selected_aircraft):
         command = input('\t' + selected_aircraft.callsign + ': ').lower().lstrip()
 
-        if command == 'p': selected_aircraft.paused = True
-        elif command == 'u': selected_aircraft.paused = False
-
-        try:
-            # Break down the command into two parts
-            instruction = command[0]
-            value = command[1:]
-
-            # Heading
-            if instruction == 'h':
-                selected_aircraft.set_target_heading(int(value))
-            # Altitude
-            elif instruction == 'm' or instruction == 'd' or instruction == 'c':
-                selected_aircraft.set_target_alt(int(value) * 100)
-            # Speed
-            elif instruction == 's':
-                selected_aircraft.target_spd = int(value) + c.iasvar
-            # Approach
-            elif instruction == 'a' or instruction == 'i':
-                for rwy in c.data['runways']:
-                    if rwy.get('id') == value.upper():
-                        selected_aircraft.set_target_rwy(rwy)
-                        break
-            # Direct next waypoint
-            elif instruction == '>' and value == '>':
-                selected_aircraft.target_wpt_index += 1
-                selected_aircraft.set_target_wpt()
+        if not command:
+            return
+        if command == 'p':
+            selected_aircraft.paused = True
+            return
+        if command == 'u':
+            selected_aircraft.paused = False
+            return
+
+        # Break down the command into two parts
+        instruction = command[0]
+        value = command[1:]
+
+        # Validate the value upfront for the instructions that need a number
+        if instruction in ('h', 'm', 'd', 'c', 's', 'b'):
+            number = _as_int(value)
+            if number is None:
+                print('Invalid instruction!')
+                return
+
+        # Heading
+        if instruction == 'h':
+            selected_aircraft.set_target_heading(number)
+        # Altitude
+        elif instruction == 'm' or instruction == 'd' or instruction == 'c':
+            selected_aircraft.set_target_alt(number * 100)
+        # Speed
+        elif instruction == 's':
+            selected_aircraft.target_spd = number + c.iasvar
+        # Approach
+        elif instruction == 'a' or instruction == 'i':
+            rwy = c.runways_by_id.get(value.upper())
+            if rwy is not None:
+                selected_aircraft.set_target_rwy(rwy)
+        # Direct next waypoint
+        elif instruction == '>' and value == '>':
+            selected_aircraft.target_wpt_index += 1
+            selected_aircraft.set_target_wpt()
+            if selected_aircraft.target_wpt_index < len(selected_aircraft.route):
                 print('Proceeding direct to ' +
                       selected_aircraft.route[selected_aircraft.target_wpt_index])
-            # New route
-            elif instruction == '>':
-                selected_aircraft.set_route(value.upper())
-            # Beacon code (squawk)
-            elif instruction == 'b':
-                selected_aircraft.sq = int(value)
-            # Disconnect aircraft
-            elif instruction == 'x':
-                selected_aircraft.disconnect_aircraft()
-        except:
+            else:
+                print('Invalid instruction!')
+        # New route
+        elif instruction == '>':
+            selected_aircraft.set_route(value.upper())
+        # Beacon code (squawk)
+        elif instruction == 'b':
+            selected_aircraft.sq = number
+        # Disconnect aircraft
+        elif instruction == 'x':
+            selected_aircraft.disconnect_aircraft()
+        else:
             print('Invalid instruction!')
 
 
@@ -174,16 +233,13 @@ class OpenTargetGenerator:
             bool -- [Return true if super_commands() loop must continue]
         """
         if command == 'EXIT':
-            for ac in self.aircraft_list:
-                self.delete_all_aircraft()
+            self.delete_all_aircraft()
             sys.exit()
         elif command == 'P':
-            for ac in self.aircraft_list:
-                ac.paused = True
+            self.fleet.set_paused(True)
             return True
         elif command == 'U':
-            for ac in self.aircraft_list:
-                ac.paused = False
+            self.fleet.set_paused(False)
             return True
         elif command == 'RELOAD':
             self.delete_all_aircraft()
@@ -5,7 +5,9 @@ This module calculates and sends positional data for each aircraft to fgms.py fo
 mp data packing every 0.5 seconds.
 """
 
-from coords import moved, heading_to, distance_to
+from math import radians, degrees, copysign, sin, cos
+
+from coords import njit, moved_rad, heading_to_rad, bearing_and_distance_rad, bearing_and_distance_to_fix
 import constants as c
 
 
@@ -34,6 +36,24 @@ free_speed_increment = 40 / free_speed_distance
 # -------------------------------
 
 
+@njit(cache=True, fastmath=True)
+def _tick_kernel(alt, target_alt, spd, target_spd, heading, lat_rad, lon_rad):
+    """Fused altitude/speed/position step for one update interval.
+
+    Pure arithmetic on scalars, so with Numba available the whole tail of
+    the tick compiles to a single native kernel.
+    """
+    if alt != target_alt:
+        if abs(alt - target_alt) >= climb_descent_rate:
+            alt = alt - climb_descent_rate if alt > target_alt else alt + climb_descent_rate
+        else:
+            alt = target_alt
+    if spd != target_spd:
+        spd = spd - 1 if spd > target_spd else spd + 1
+    lat_rad, lon_rad = moved_rad(lat_rad, lon_rad, heading, spd / updates_per_hr)
+    return alt, spd, lat_rad, lon_rad
+
+
 class Aircraft:
     def __init__(self, ac):
         self.handler = None  # Stores the aircraft's handler object
@@ -43,10 +63,17 @@ class Aircraft:
         self.sq = int(ac.get('sq'))
         self.lat = float(ac.get('lat'))
         self.lon = float(ac.get('lon'))
+        # Radian copies, kept in sync so the per-tick trig skips the
+        # degree conversions.
+        self.lat_rad = radians(self.lat)
+        self.lon_rad = radians(self.lon)
         self.alt = int(ac.get('alt'))
         self.spd = int(ac.get('spd'))
         self.ac_type = ac.get('type')
         self.route = ac.get('route').split()  # list of waypoints
+        # Resolve the names to pre-parsed coordinate tuples once;
+        # unknown waypoints resolve to None.
+        self.route_coords = [c.navaids_by_name.get(name) for name in self.route]
 
         # Target variables
         self.target_alt = self.alt
@@ -69,8 +96,10 @@ class Aircraft:
     # ----------------
 
     def get_pos(self):
-        """Update position if needed and return it."""
-        self.control_aircraft()
+        """Return the current position.
+
+        Position updates are driven by the shared update scheduler.
+        """
         return self.lon, self.lat, self.alt
 
     def get_vel_x(self):
@@ -91,12 +120,13 @@ class Aircraft:
         self.status = 'route'
         self.target_wpt_index = 0
         self.route = route.split()
+        self.route_coords = [c.navaids_by_name.get(name) for name in self.route]
         self.set_target_wpt()
 
     def set_target_heading(self, target_heading):
         """Set the target heading plus magnetic variation."""
         self.status = 'heading'
-        self.target_heading = (target_heading - c.data['magvar']) % 360
+        self.target_heading = (target_heading - c.magvar) % 360
 
     def set_target_alt(self, target_alt):
         """Set the target altitude."""
@@ -104,29 +134,39 @@ class Aircraft:
         self.target_alt = target_alt
 
     def set_target_rwy(self, rwy):
-        """Set the target runway."""
+        """Set the target runway.
+
+        rwy is a pre-parsed (lat, lon, crs, elev) tuple from
+        c.runways_by_id.
+        """
         self.status = 'approach'
-        self.target_rwy_lat = float(rwy.get('lat'))
-        self.target_rwy_lon = float(rwy.get('lon'))
-        self.target_rwy_crs = int(rwy.get('crs')) - c.data['magvar']
-        self.target_rwy_elev = int(rwy.get('elev'))
+        self.target_rwy_lat, self.target_rwy_lon, crs, self.target_rwy_elev = rwy
+        self.target_rwy_lat_rad = radians(self.target_rwy_lat)
+        self.target_rwy_lon_rad = radians(self.target_rwy_lon)
+        # The rwy never moves, so its latitude trig is evaluated once here
+        # instead of on every approach tick.
+        self.target_rwy_sin_lat = sin(self.target_rwy_lat_rad)
+        self.target_rwy_cos_lat = cos(self.target_rwy_lat_rad)
+        self.target_rwy_crs = crs - c.magvar
 
     def set_target_wpt(self):
         """Obtain coordinates of target waypoint."""
         try:
-            for wp in c.data['navaids']:
-                if wp.get('name') == self.route[self.target_wpt_index]:
-                    self.target_wpt_lat = float(wp.get('lat'))
-                    self.target_wpt_lon = float(wp.get('lon'))
-                    self.target_wpt_alt = int(wp.get('alt', 0))
-                    break
+            (self.target_wpt_lat, self.target_wpt_lon, self.target_wpt_alt,
+             self.target_wpt_lat_rad, self.target_wpt_lon_rad) = self.route_coords[self.target_wpt_index]
         except:
-            self.set_target_heading(self.heading + c.data['magvar'])
+            self.set_target_heading(self.heading + c.magvar)
 
     def disconnect_aircraft(self):
         """Disconnect the aircraft."""
-        self.handler.stop()
-        del self.handler
+        if self.handler is not None:
+            self.handler.stop()
+            self.handler = None
+
+    def delete_aircraft(self):
+        """Stop and disconnect the aircraft once it has reached the rwy."""
+        self.paused = True
+        self.disconnect_aircraft()
 
     # ----------------
 
@@ -143,29 +183,21 @@ class Aircraft:
                 self.adjust_heading()
             elif self.status == 'approach':
                 self.check_ils_feather()
-            self.adjust_alt()
-            self.adjust_speed()
-            self.move_position()
-
-    def check_heading(self):
-        """Ensure that the heading does not become negative or greater than 360."""
-        self.heading %= 360
-
-    # ---------------------------------------------------------------------------------------------------------
+            self.alt, self.spd, self.lat_rad, self.lon_rad = _tick_kernel(
+                self.alt, self.target_alt, self.spd, self.target_spd,
+                self.heading, self.lat_rad, self.lon_rad)
+            self.lat = degrees(self.lat_rad)
+            self.lon = degrees(self.lon_rad)
 
     def turn_one_degree(self, target_hdg):
-        """Turn aircraft by one degree towards the shortest direction needed to reach target heading."""
-        if self.heading != target_hdg:
-            turn_right = (self.heading - target_hdg + 360) % 360 > 180  # True = right turn; False = left turn
-            self.heading = self.heading + 1 if turn_right else self.heading - 1
-        self.check_heading()
+        """Turn aircraft towards the target heading, at most one degree per update.
 
-    # ---------------------------------------------------------------------------------------------------------
-
-    def move_position(self):
-        """Move position based on distance per update interval."""
-        distance = self.spd / updates_per_hr
-        self.lat, self.lon = moved(self.lat, self.lon, self.heading, distance)
+        The signed difference picks the shortest direction, and the step
+        is capped so the heading lands exactly on the target.
+        """
+        diff = (target_hdg - self.heading + 540) % 360 - 180
+        if diff:
+            self.heading = (self.heading + copysign(min(1, abs(diff)), diff)) % 360
 
     # ---------------------------------------------------------------------------------------------------------
 
@@ -176,58 +208,41 @@ class Aircraft:
 
     # ---------------------------------------------------------------------------------------------------------
 
-    def adjust_alt(self):
-        """Adjust the current altitude by climb_descent_rate."""
-        if self.alt != self.target_alt:
-            if abs(self.alt - self.target_alt) >= climb_descent_rate:
-                self.alt = self.alt - climb_descent_rate if self.alt > self.target_alt else self.alt + climb_descent_rate
-            else:
-                self.alt = self.target_alt
-
-    # ---------------------------------------------------------------------------------------------------------
-
-    def adjust_speed(self):
-        """Adjust the current speed by one knot."""
-        if self.spd != self.target_spd:
-            self.spd = self.spd - 1 if self.spd > self.target_spd else self.spd + 1
-
-    # ---------------------------------------------------------------------------------------------------------
-
     def check_ils_feather(self):
         """Check if the aircraft needs to turn for the approach.
 
         Begin turning if the aircraft is within a 2-degree "feather" within 12 NM from the rwy TDZ, or
         within 1-degree "feather" outside of 12 NM.
         """
-        # Get current bearing to runway TDZ
-        current_bearing = round(heading_to(self.lat, self.lon, self.target_rwy_lat, self.target_rwy_lon))
-        dme = distance_to(self.lat, self.lon, self.target_rwy_lat, self.target_rwy_lon)
-
-        if abs(current_bearing - self.target_rwy_crs) <= 2 and dme < 12:
-            self.turn_to_centerline(current_bearing)
-        elif abs(current_bearing - self.target_rwy_crs) <= 1 and dme >= 12:
+        # Get current bearing and distance to runway TDZ
+        current_bearing, dme = bearing_and_distance_to_fix(self.lat_rad, self.lon_rad,
+                                                           self.target_rwy_lat_rad,
+                                                           self.target_rwy_sin_lat, self.target_rwy_cos_lat,
+                                                           self.target_rwy_lon_rad)
+        current_bearing = round(current_bearing)
+
+        feather_width = 2 if dme < 12 else 1
+        if abs(current_bearing - self.target_rwy_crs) <= feather_width:
             self.turn_to_centerline(current_bearing)
         else:
             self.turn_one_degree(self.target_heading)
 
-        self.descend_to_rwy()
+        self.descend_to_rwy(dme)
 
     # ---------------------------------------------------------------------------------------------------------
 
     def turn_to_centerline(self, brg):
         """Turn the aircraft to the centerline for approach."""
-        if brg == self.target_rwy_crs:
-            self.turn_one_degree(brg)
-        elif brg > self.target_rwy_crs:
-            self.turn_one_degree(brg + shallow_intercept_angle)
-        elif brg < self.target_rwy_crs:
-            self.turn_one_degree(brg - shallow_intercept_angle)
+        offset = copysign(shallow_intercept_angle, brg - self.target_rwy_crs) if brg != self.target_rwy_crs else 0
+        self.turn_one_degree(brg + offset)
 
     # ---------------------------------------------------------------------------------------------------------
 
-    def descend_to_rwy(self):
-        """Descend the aircraft to the runway, following a 3-deg glidepath angle."""
-        dme = distance_to(self.lat, self.lon, self.target_rwy_lat, self.target_rwy_lon)  # distance to rwy
+    def descend_to_rwy(self, dme):
+        """Descend the aircraft to the runway, following a 3-deg glidepath angle.
+
+        dme is the distance to the rwy, already known by the caller.
+        """
         glidepath_alt = int(300 * dme + self.target_rwy_elev)  # 300 ft / NM =~ 3 deg glidepath
 
         # Check if calculated glidepath is below current alt.
@@ -251,8 +266,9 @@ class Aircraft:
 
     def fly_route(self):
         """Guide aircraft along the route."""
-        dme = distance_to(self.lat, self.lon, self.target_wpt_lat, self.target_wpt_lon)
-        current_bearing = self.bearing_to_target_wpt()
+        current_bearing, dme = bearing_and_distance_rad(self.lat_rad, self.lon_rad,
+                                                        self.target_wpt_lat_rad, self.target_wpt_lon_rad)
+        current_bearing = round(current_bearing)
 
         # Check if target waypoint has a pre-specified crossing altitude
         if self.target_wpt_alt != 0:
@@ -272,5 +288,5 @@ class Aircraft:
 
     def bearing_to_target_wpt(self):
         """Calculate bearing from present position to target waypoint."""
-        bearing = heading_to(self.lat, self.lon, self.target_wpt_lat, self.target_wpt_lon)
+        bearing = heading_to_rad(self.lat_rad, self.lon_rad, self.target_wpt_lat_rad, self.target_wpt_lon_rad)
         return round(bearing)
@@ -12,8 +12,12 @@ filename = None
 scenario = None
 server_address = None
 server_port = None
-data = {'magvar': None, 
-        'navaids': None, 
-        'runways': None, 
-        'aircraft': None}
+# Scenario data, assigned by OpenTargetGenerator.get_data. Module-level
+# names are cheaper to read on the per-tick paths than a shared dict.
+magvar = None
+navaids = None
+runways = None
+aircraft = None
+navaids_by_name = None
+runways_by_id = None
 iasvar = randint(5,20)
\ No newline at end of file
@@ -19,7 +19,20 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
 import re
-from math import radians, degrees, cos, sin, acos, asin, atan2, sqrt
+from math import radians, degrees, cos, sin, acos, asin, atan2, sqrt, pi
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional: without it the primitives below simply run as
+    # plain Python functions.
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+
+        def decorate(func):
+            return func
+        return decorate
 
 # ---------- Constants ----------
 
@@ -33,19 +46,21 @@ Earth_radius_NM = m2NM * 1000 * Earth_radius_km
 # -------------------------------
 
 
+@njit(cache=True, fastmath=True)
 def moved(lat, lon, radial, distance):
     """Get the final position of a crow's flight starting with a given heading."""
     lat1 = radians(lat)
     lon1 = radians(lon)
     a = radians(radial)
     d = distance / Earth_radius_NM
-    lat2 = asin(sin(lat1) * cos(d) + cos(lat1) * sin(d) * cos(a))
+    lat2 = asin(min(1.0, max(-1.0, sin(lat1) * cos(d) + cos(lat1) * sin(d) * cos(a))))
     lon2 = lon1 + atan2(sin(a) * sin(d) * cos(lat1), cos(d) - sin(lat1) * sin(lat2))
     lat_res = (degrees(lat2) + 90) % 180 - 90
     lon_res = (degrees(lon2) + 180) % 360 - 180
     return lat_res, lon_res
 
 
+@njit(cache=True, fastmath=True)
 def heading_to(lat1, lon1, lat2, lon2):
     """Get the heading between two coordinates.
 
@@ -58,15 +73,87 @@ def heading_to(lat1, lon1, lat2, lon2):
     return degrees(theta) % 360
 
 
+@njit(cache=True, fastmath=True)
 def distance_to(lat1, lon1, lat2, lon2):
-    """Get the distance betweeen two coordinates."""
+    """Get the distance betweeen two coordinates.
+
+    Uses the haversine formula, which stays well-conditioned at the short
+    distances where the spherical law of cosines loses precision.
+    """
     lat1 = radians(lat1)
     lat2 = radians(lat2)
     dlon = radians(lon2 - lon1)
-    try:
-        return acos(sin(lat1) * sin(lat2) + cos(lat1) * cos(lat2) * cos(dlon)) * Earth_radius_NM
-    except ValueError:  # Caught as every time was only acos of value just over 1, probably from non-critical approximations
-        return 0  # acos(1)
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * Earth_radius_NM * asin(sqrt(a))
+
+
+# ======= Radian-space variants =======
+
+# Used on the per-tick path, where callers cache their coordinates in
+# radians and avoid the degree conversions on every call.
+
+
+@njit(cache=True, fastmath=True)
+def moved_rad(lat_rad, lon_rad, radial, distance):
+    """moved() for radian coordinates; returns the new position in radians."""
+    a = radians(radial)
+    d = distance / Earth_radius_NM
+    lat2 = asin(min(1.0, max(-1.0, sin(lat_rad) * cos(d) + cos(lat_rad) * sin(d) * cos(a))))
+    lon2 = lon_rad + atan2(sin(a) * sin(d) * cos(lat_rad), cos(d) - sin(lat_rad) * sin(lat2))
+    lon2 = (lon2 + pi) % (2 * pi) - pi
+    return lat2, lon2
+
+
+@njit(cache=True, fastmath=True)
+def heading_to_rad(lat1, lon1, lat2, lon2):
+    """heading_to() for radian coordinates; returns the heading in degrees."""
+    dlon = lon2 - lon1
+    theta = atan2(sin(dlon) * cos(lat2), cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(dlon))
+    return degrees(theta) % 360
+
+
+@njit(cache=True, fastmath=True)
+def distance_to_rad(lat1, lon1, lat2, lon2):
+    """distance_to() for radian coordinates."""
+    dlon = lon2 - lon1
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * Earth_radius_NM * asin(sqrt(a))
+
+
+@njit(cache=True, fastmath=True)
+def bearing_and_distance_rad(lat1, lon1, lat2, lon2):
+    """Get both the heading and the distance between two radian coordinates.
+
+    Fuses heading_to_rad and distance_to_rad so the shared sin/cos
+    intermediates are evaluated once.
+    """
+    sin_lat1 = sin(lat1)
+    cos_lat1 = cos(lat1)
+    sin_lat2 = sin(lat2)
+    cos_lat2 = cos(lat2)
+    dlon = lon2 - lon1
+    theta = atan2(sin(dlon) * cos_lat2, cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos(dlon))
+    bearing = degrees(theta) % 360
+    a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * sin(dlon / 2) ** 2
+    distance = 2 * Earth_radius_NM * asin(sqrt(a))
+    return bearing, distance
+
+
+@njit(cache=True, fastmath=True)
+def bearing_and_distance_to_fix(lat_rad, lon_rad, fix_lat_rad, fix_sin_lat, fix_cos_lat, fix_lon_rad):
+    """bearing_and_distance_rad() against a fix whose latitude trig is precomputed.
+
+    Fixes (runways, waypoints) keep the same position for many ticks, so
+    callers can evaluate sin/cos of the fix latitude once at set time.
+    """
+    sin_lat1 = sin(lat_rad)
+    cos_lat1 = cos(lat_rad)
+    dlon = fix_lon_rad - lon_rad
+    theta = atan2(sin(dlon) * fix_cos_lat, cos_lat1 * fix_sin_lat - sin_lat1 * fix_cos_lat * cos(dlon))
+    bearing = degrees(theta) % 360
+    a = sin((fix_lat_rad - lat_rad) / 2) ** 2 + cos_lat1 * fix_cos_lat * sin(dlon / 2) ** 2
+    distance = 2 * Earth_radius_NM * asin(sqrt(a))
+    return bearing, distance
 
 
 # ======= WGS84 geodesy =======
@@ -81,6 +168,7 @@ e2 = abs(1 - WGS84_squash * WGS84_squash)
 e4 = e2 * e2
 
 
+@njit(cache=True, fastmath=True)
 def WGS84_geodetic_to_cartesian_metres(lon, lat, ftAMSL):
     """Earth centred cartesian coordinates from geodetic coordinates on the WGS84 ellipsoid.
 
@@ -18,13 +18,12 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
-import threading
-from time import sleep
 from datetime import datetime, timezone
-from struct import pack, unpack
-from math import radians, pi, cos, sin, acos
+from time import monotonic
+from struct import Struct
+from math import radians, pi, cos, sin, acos, sqrt
 
-from coords import WGS84_geodetic_to_cartesian_metres
+from coords import njit, WGS84_equrad, e2, m2ft
 import constants as c
 
 
@@ -35,11 +34,48 @@ maximum_packet_size = 2048
 dodgy_character_substitute = '_'
 
 timestamp_ignore_maxdiff = 10  # s (as specified in FGMS packets)
-FGMS_handshake_interval = 0.5  # seconds
+
+# Precompiled Structs, so the format strings are parsed once at import
+# instead of on every pack call.
+_S_I = Struct('!i')
+_S_F = Struct('!f')
+_S_D = Struct('!d')
 
 # -------------------------------
 
 
+_int_array_structs = {}
+
+
+def _int_array_struct(n):
+    """Return a cached Struct packing n big-endian ints.
+
+    Buggy-string lengths repeat constantly (callsigns, chat, property
+    strings), so each format is compiled once.
+    """
+    s = _int_array_structs.get(n)
+    if s is None:
+        s = _int_array_structs[n] = Struct('!%di' % n)
+    return s
+
+
+_padded_cache = {}
+
+
+def _padded(size, string):
+    """Return string encoded and zero-padded to size bytes, memoized.
+
+    Callsigns and model names recur for the life of an aircraft, so each
+    distinct value is encoded and padded only once.
+    """
+    key = (size, string)
+    value = _padded_cache.get(key)
+    if value is None:
+        raw = bytes(string, encoding)[:size - 1]
+        value = _padded_cache[key] = raw + bytes(size - len(raw))
+    return value
+
+
 class PacketData:
     """
     Data packer/unpacker for FGFS stuff.
@@ -48,13 +84,16 @@ class PacketData:
     "buggy strings" (encoded with int sequences), etc.
     """
 
-    def __init__(self, data=None):
-        self.data = self.some(data, bytes(0))
+    # Fixed attribute slots: faster attribute access and no per-instance
+    # dict for an object created on every packet.
+    __slots__ = ('data', 'pos', '_view')
 
-    def some(self, value, fallback):
-        if value is not None:
-            return value
-        return fallback
+    def __init__(self, data=None):
+        # bytearray so appends are amortised in-place instead of
+        # reallocating the whole buffer per field.
+        self.data = bytearray(data) if data is not None else bytearray()
+        self.pos = 0  # read cursor for the unpack_* methods
+        self._view = None  # memoryview over data, created on first read
 
     def allData(self):
         return self.data
@@ -68,52 +107,64 @@ class PacketData:
     def pack_bool(self, b):
         self.pack_int(int(b))
     def pack_int(self, i):
-        self.data += pack('!i', i)
+        self.data.extend(_S_I.pack(i))
     def pack_float(self, f):
-        self.data += pack('!f', f)
+        self.data.extend(_S_F.pack(f))
     def pack_double(self, d):
-        self.data += pack('!d', d)
+        self.data.extend(_S_D.pack(d))
     def pack_string(self, size, string):  # For padded null-terminated string
-        self.data += pack('%ds' % size, bytes(string, encoding)[:size-1])
+        self.data.extend(_padded(size, string))
     def append_bytes(self, raw_data):
-        self.data += raw_data
+        self.data.extend(raw_data)
     def append_packed(self, data):
-        self.data += data.allData()
+        self.data.extend(data.allData())
     def append_hexbytes(self, data):  # Data is a string of hex-represented bytes
-        self.data += bytes.fromhex(data)
+        self.data.extend(bytes.fromhex(data))
     def pack_FGFS_buggy_string(self, string):
-        strbuf = PacketData()
-        for c in string:
-            strbuf.pack_int(ord(c))
-        strbuf.pad(16)
+        # One struct call packs all the character codes at once.
+        packed = _int_array_struct(len(string)).pack(*map(ord, string))
         self.pack_int(len(string))
-        self.append_packed(strbuf)
+        self.data.extend(packed)
+        self.data.extend(bytes(-len(packed) % 16))
 
     def unpack_bytes(self, nbytes):
-        popped = self.data[:nbytes]
-        self.data = self.data[nbytes:]
-        if len(popped) < nbytes:
-            print('WARNING: Truncated packet detected. Expected %d bytes; only %d could be read.' % (nbytes, len(popped)))
+        # Reads go through a memoryview, so each field is a zero-copy
+        # window into the buffer instead of a bytes slice. Note that the
+        # view pins the buffer: no more packing once decoding has begun.
+        if self._view is None:
+            self._view = memoryview(self.data)
+        end = self.pos + nbytes
+        if end > len(self.data):
+            print('WARNING: Truncated packet detected. Expected %d bytes; only %d could be read.' % (nbytes, len(self.data) - self.pos))
+            self.pos = len(self.data)
             return bytes(nbytes)
+        popped = self._view[self.pos:end]
+        self.pos = end
         return popped
+    def _unpack_value(self, s, nbytes):
+        if self.pos + nbytes > len(self.data):
+            print('WARNING: Truncated packet detected. Expected %d bytes; only %d could be read.' % (nbytes, len(self.data) - self.pos))
+            self.pos = len(self.data)
+            return 0
+        value = s.unpack_from(self.data, self.pos)[0]
+        self.pos += nbytes
+        return value
     def unpack_int(self):
-        return unpack('!i', self.unpack_bytes(4))[0]
+        return self._unpack_value(_S_I, 4)
     def unpack_float(self):
-        return unpack('!f', self.unpack_bytes(4))[0]
+        return self._unpack_value(_S_F, 4)
     def unpack_double(self):
-        return unpack('!d', self.unpack_bytes(8))[0]
+        return self._unpack_value(_S_D, 8)
     def unpack_string(self, size):
-        return self.unpack_bytes(size).split(b'\x00', 1)[0].decode()
+        return bytes(self.unpack_bytes(size)).split(b'\x00', 1)[0].decode()
     def unpack_bool(self):
         return self.unpack_int()
     def unpack_FGFS_buggy_string(self):
         nchars = self.unpack_int()
-        intbytes = PacketData(self.unpack_bytes((((4 * nchars - 1) // 16) + 1) * 16))
-        chrlst = []
-        for i in range(nchars):
-            try: chrlst.append(chr(intbytes.unpack_int()))
-            except ValueError: chrlst.append(dodgy_character_substitute)
-        return ''.join(chrlst)
+        raw = self.unpack_bytes((((4 * nchars - 1) // 16) + 1) * 16)
+        codes = _int_array_struct(nchars).unpack_from(raw)
+        return ''.join(chr(code) if 0 <= code <= 0x10FFFF and not 0xD800 <= code <= 0xDFFF
+                       else dodgy_character_substitute for code in codes)
 
 # ----------------
 
@@ -122,62 +173,47 @@ class PacketData:
 # ----------------
 
 
-def make_position_message(callsign, data):
-    packet = PacketData()
+# 32-byte position-message header template: FGFS magic, protocol
+# version 1.1 and message type 7, followed by zeroed slots for the
+# length (offset 12), two ignored words and the callsign (offset 24),
+# which get patched in per header.
+_HEADER_TEMPLATE = b'FGFS\x00\x01\x00\x01\x00\x00\x00\x07' + bytes(20)
+
 
-    # Header first (32 bytes)
-    packet.append_bytes(b'FGFS')  # Magic
-    packet.append_hexbytes('00 01 00 01')  # Protocol version 1.1
-    packet.append_hexbytes('00 00 00 07')  # Type: position message
-    packet.pack_int(32 + len(data))  # Length of data
-    packet.append_hexbytes('00 00 00 00')  # Ignored
-    packet.append_hexbytes('00 00 00 00')  # Ignored
-    packet.pack_string(8, callsign)  # Callsign
-    # Append the data
-    packet.append_packed(data)
-    return packet
+def make_position_header(callsign, data_len):
+    """Build the 32-byte FGFS header for a position message."""
+    header = bytearray(_HEADER_TEMPLATE)
+    _S_I.pack_into(header, 12, 32 + data_len)
+    header[24:32] = _padded(8, callsign)
+    return header
 
 
-def position_data(aircraft_model, lon, lat, pos_amsl, hdg, velx, pitch=0, roll=0):
-    """pos_coords: EarthCoords.
+# Time, lag, PosX/Y/Z, OriX/Y/Z, VelX/Y/Z, AV1-3, LA1-3, AA1-3, the
+# 4-byte padding and the four XPDR property ints: everything in a
+# position message after the model, emitted as one struct call.
+_TAIL_STRUCT = Struct('!2d3d3f12f4s4i')
 
-    pos_amsl should be geometric alt in feet.
+
+class FGMShandshaker:
+    """Builds and sends one aircraft's position packets.
+
+    Sending is driven by the shared update scheduler in
+    OpenTargetGenerator; each send_update call emits one position message.
     """
-    buf = PacketData()
-    buf.pack_string(96, aircraft_model)  # Aircraft model
-    buf.pack_double(read_stopwatch())  # Time
-    buf.pack_double(0)  # Lag
-    posX, posY, posZ = WGS84_geodetic_to_cartesian_metres(lon, lat, pos_amsl)
-    buf.pack_double(posX)  # PosX
-    buf.pack_double(posY)  # PosY
-    buf.pack_double(posZ)  # PosZ
-    oriX, oriY, oriZ = FG_orientation_XYZ(lon, lat, hdg, pitch, roll)
-    buf.pack_float(oriX)  # OriX
-    buf.pack_float(oriY)  # OriY
-    buf.pack_float(oriZ)  # OriZ
-    buf.pack_float(velx)  # VelX
-    buf.pack_float(0)  # VelY
-    buf.pack_float(0)  # VelZ
-    buf.pack_float(0)  # AV1
-    buf.pack_float(0)  # AV2
-    buf.pack_float(0)  # AV3
-    buf.pack_float(0)  # LA1
-    buf.pack_float(0)  # LA2
-    buf.pack_float(0)  # LA3
-    buf.pack_float(0)  # AA1
-    buf.pack_float(0)  # AA2
-    buf.pack_float(0)  # AA3
-    buf.append_hexbytes('00 00 00 00')  # 4-byte padding
-    return buf
-
-
-class FGMShandshaker(threading.Thread): 
+
     def __init__(self, socket, aircraft):
-        threading.Thread.__init__(self)
         self.socket = socket
         self.aircraft = aircraft
         self.current_chat_msg = ''
-        self.handshaker_run = True
+        # The callsign, model and packet length are fixed for the life
+        # of the aircraft, so the entire constant prefix of the packet
+        # is baked here; each tick only packs the variable tail.
+        data_len = 96 + _TAIL_STRUCT.size  # model + tail
+        self._prefix = bytes(make_position_header(aircraft.callsign, data_len)) + _padded(96, aircraft.ac_type)
+        # Last computed pose and its inputs, reused while the aircraft
+        # does not move (e.g. when paused).
+        self._last_pose_key = None
+        self._last_pose = None
 
     def currentChatMessage(self):
         return self.current_chat_msg
@@ -185,24 +221,23 @@ class FGMShandshaker(threading.Thread):
     def setChatMessage(self, msg):
         self.current_chat_msg = msg
 
-    def run(self):
-        while self.handshaker_run:
-            lon, lat, alt = self.aircraft.get_pos()
-            data = position_data(self.aircraft.ac_type, lon, lat, alt, self.aircraft.heading, self.aircraft.get_vel_x())
-            data.pack_int(FGMS_prop_XPDR_code)
-            data.pack_int(self.aircraft.sq)
-            data.pack_int(FGMS_prop_XPDR_alt)
-            data.pack_int(alt)
-            packet = make_position_message(self.aircraft.callsign, data)
-            # print('Sending packet with size %d=0x%x bytes. Optional data is: %s' % (len(packet), len(packet), packet.data[228:])) # DEBUG
-            try:
-                self.socket.sendto(packet.allData(), (c.server_address, c.server_port))
-            except OSError as error:
-                print('Could not send FGMS packet to server. System says: %s' % error)
-            sleep(FGMS_handshake_interval)
-
-    def set_status(self, status):
-        self.handshaker_run = status
+    def build_packet(self, time=None):
+        """Build one position message for the aircraft."""
+        lon, lat, alt = self.aircraft.get_pos()
+        pose_key = (lon, lat, alt, self.aircraft.heading)
+        if pose_key != self._last_pose_key:
+            self._last_pose_key = pose_key
+            self._last_pose = build_pose(lon, lat, alt, self.aircraft.heading, 0, 0)
+        posX, posY, posZ, oriX, oriY, oriZ = self._last_pose
+        return self._prefix + _TAIL_STRUCT.pack(read_stopwatch() if time is None else time, 0.0,
+                                                posX, posY, posZ, oriX, oriY, oriZ,
+                                                self.aircraft.get_vel_x(), 0.0, 0.0,  # velocities
+                                                0.0, 0.0, 0.0,  # angular velocities
+                                                0.0, 0.0, 0.0,  # linear accelerations
+                                                0.0, 0.0, 0.0,  # angular accelerations
+                                                b'',            # 4-byte padding
+                                                FGMS_prop_XPDR_code, self.aircraft.sq,
+                                                FGMS_prop_XPDR_alt, alt)
 
 FGMS_properties = {
   100: ('surface-positions/left-aileron-pos-norm',  PacketData.unpack_float),
@@ -380,8 +415,40 @@ FGMS_properties = {
   10319: ('sim/multiplay/generic/int[19]', PacketData.unpack_int)
 }
 
+# Fast-path dispatch for property decoding. The table is a flat list
+# indexed directly by property code, so the decode loop does a list
+# subscript instead of a dict hash, and the entries carry small type
+# tags instead of bound-method objects.
+_PROP_INT, _PROP_FLOAT, _PROP_BOOL, _PROP_BSTRING = range(4)
+
+_UNPACKERS = (PacketData.unpack_int, PacketData.unpack_float,
+              PacketData.unpack_bool, PacketData.unpack_FGFS_buggy_string)
+
+_PROP_MAX = max(FGMS_properties)
+_PROP_TABLE = [None] * (_PROP_MAX + 1)
+for _code, (_name, _unpack) in FGMS_properties.items():
+    _PROP_TABLE[_code] = (_name, _UNPACKERS.index(_unpack))
+
+
+def unpack_property(packet, code):
+    """Decode one property value from a PacketData.
+
+    Returns a (name, value) tuple, or (None, None) for unknown codes.
+    """
+    entry = _PROP_TABLE[code] if 0 <= code <= _PROP_MAX else None
+    if entry is None:
+        return None, None
+    name, tag = entry
+    return name, _UNPACKERS[tag](packet)
+
+
+# Reverse index, so name lookups are a dict hit instead of a scan over
+# all properties.
+_FGMS_code_by_name = {data[0]: code for code, data in FGMS_properties.items()}
+
+
 def FGMS_prop_code_by_name(name):
-    return next(code for code, data in FGMS_properties.items() if data[0] == name)
+    return _FGMS_code_by_name[name]
 
 
 FGMS_prop_comm_frq = FGMS_prop_code_by_name('sim/multiplay/transmission-freq-hz')  # STRING
@@ -395,6 +462,7 @@ FGMS_prop_XPDR_mode = FGMS_prop_code_by_name('instrumentation/transponder/inputs
 
 epsilon = 1e-8
 
+@njit(cache=True, fastmath=True)
 def wxyz_quat_mult(q1, q2):
     w1, x1, y1, z1 = q1
     w2, x2, y2, z2 = q2
@@ -407,6 +475,7 @@ def wxyz_quat_mult(q1, q2):
 
 
 
+@njit(cache=True, fastmath=True)
 def earth2quat(lon, lat):
     zd2 = radians(lon) / 2
     yd2 = -pi / 4 - radians(lat) / 2
@@ -421,6 +490,7 @@ def earth2quat(lon, lat):
     return w, x, y, z
 
 
+@njit(cache=True, fastmath=True)
 def euler2quat(z, y, x):
     zd2 = z / 2
     yd2 = y / 2
@@ -444,6 +514,7 @@ def euler2quat(z, y, x):
 
 
 
+@njit(cache=True, fastmath=True)
 def FG_orientation_XYZ(lon, lat, hdg, pitch, roll):
     local_rot = euler2quat(radians(hdg), radians(pitch), radians(roll))
     qw, qx, qy, qz = wxyz_quat_mult(earth2quat(lon, lat), local_rot)
@@ -457,16 +528,52 @@ def FG_orientation_XYZ(lon, lat, hdg, pitch, roll):
         return k*qx, k*qy, k*qz
 
 
+@njit(cache=True, fastmath=True)
+def build_pose(lon, lat, ftAMSL, hdg, pitch, roll):
+    """Fused WGS84 position and FGFS orientation for one aircraft.
+
+    Computes the ECEF coordinates and the orientation axis-angle in one
+    kernel, sharing the lon/lat radian conversions, so with Numba the
+    whole pose is a single native call on the packet path.
+    """
+    l = radians(lon)
+    phi = radians(lat)
+    h = ftAMSL / m2ft
+    sphi = sin(phi)
+    cphi = cos(phi)
+    n = WGS84_equrad / sqrt(1 - e2 * sphi * sphi)
+    posX = (h + n) * cphi * cos(l)
+    posY = (h + n) * cphi * sin(l)
+    posZ = (h + n - e2 * n) * sphi
+    # Earth quaternion, from the half-angles of the same l and phi.
+    zd2 = l / 2
+    yd2 = -pi / 4 - phi / 2
+    Szd2 = sin(zd2)
+    Syd2 = sin(yd2)
+    Czd2 = cos(zd2)
+    Cyd2 = cos(yd2)
+    earthq = (Czd2 * Cyd2, -Szd2 * Syd2, Czd2 * Syd2, Szd2 * Cyd2)
+    local_rot = euler2quat(radians(hdg), radians(pitch), radians(roll))
+    qw, qx, qy, qz = wxyz_quat_mult(earthq, local_rot)
+    acw = acos(qw)
+    sa = sin(acw)
+    if abs(sa) < epsilon:
+        return posX, posY, posZ, 1.0, 0.0, 0.0  # no rotation
+    angle = 2 * acw
+    k = angle / sa
+    return posX, posY, posZ, k * qx, k * qy, k * qz
+
+
 # ======= Time stuff =======
 
 
 def now():
     return datetime.now(timezone.utc)
 
-last_stopwatch_reset = now()
+_stopwatch_start = monotonic()
 
 def read_stopwatch():
     '''
-    returns a timedelta
+    returns the seconds elapsed since module load, as a float
     '''
-    return (now() - last_stopwatch_reset).total_seconds()
+    return monotonic() - _stopwatch_start
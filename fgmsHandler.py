@@ -19,14 +19,134 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 
-from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_REUSEADDR
+import ctypes
+from errno import EAGAIN, EWOULDBLOCK
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_REUSEADDR, SO_SNDBUF, IPPROTO_IP, \
+    inet_aton, gethostbyname
+from struct import pack
 from fgms import FGMShandshaker
+import constants as c
 
-FGMS_handshake_interval = 0.5  # seconds
+
+# ---------- sendmmsg(2) support ----------
+
+# On Linux, one sendmmsg syscall can dispatch a whole tick's worth of
+# packets per socket, instead of one sendto syscall per packet.
+
+try:
+    _libc_sendmmsg = ctypes.CDLL(None, use_errno=True).sendmmsg
+except (OSError, AttributeError):
+    _libc_sendmmsg = None  # non-Linux libc: send_batch uses sendto
+
+_use_sendmmsg = _libc_sendmmsg is not None
+_sendmmsg_chunk = 64  # max packets per sendmmsg call
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint),
+                ('msg_iov', ctypes.POINTER(_iovec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr), ('msg_len', ctypes.c_uint)]
+
+
+def _sockaddr_in(addr):
+    """Pack a (host, port) pair into a struct sockaddr_in."""
+    return pack('=H2s4s8x', AF_INET, pack('!H', addr[1]), inet_aton(gethostbyname(addr[0])))
+
+
+def _sendmmsg(sock, packets, sockaddr):
+    """Send all packets on one socket with a single sendmmsg(2) syscall."""
+    n = len(packets)
+    name = ctypes.create_string_buffer(sockaddr, len(sockaddr))
+    bufs = [ctypes.create_string_buffer(packet, len(packet)) for packet in packets]
+    iovs = (_iovec * n)()
+    hdrs = (_mmsghdr * n)()
+    for i in range(n):
+        iovs[i].iov_base = ctypes.cast(bufs[i], ctypes.c_void_p)
+        iovs[i].iov_len = len(packets[i])
+        hdrs[i].msg_hdr.msg_name = ctypes.cast(name, ctypes.c_void_p)
+        hdrs[i].msg_hdr.msg_namelen = len(sockaddr)
+        hdrs[i].msg_hdr.msg_iov = ctypes.pointer(iovs[i])
+        hdrs[i].msg_hdr.msg_iovlen = 1
+    if _libc_sendmmsg(sock.fileno(), hdrs, n, 0) < 0:
+        raise OSError(ctypes.get_errno(), 'sendmmsg failed')
+
+# -----------------------------------------
+
+
+def send_batch(batch):
+    """Send one tick's worth of (socket, packet) pairs to the server.
+
+    On Linux, packets sharing a socket go out with sendmmsg in chunks of
+    up to 64 per syscall. Elsewhere, or if sendmmsg ever fails, every
+    packet falls back to its own sendto call.
+    """
+    global _use_sendmmsg
+    addr = (c.server_address, c.server_port)
+    if _use_sendmmsg and len(batch) > 1:
+        try:
+            sockaddr = _sockaddr_in(addr)
+            by_socket = {}
+            for sock, packet in batch:
+                by_socket.setdefault(sock, []).append(packet)
+            for sock, packets in by_socket.items():
+                for i in range(0, len(packets), _sendmmsg_chunk):
+                    _sendmmsg(sock, packets[i:i + _sendmmsg_chunk], sockaddr)
+        except OSError as error:
+            if error.errno in (EAGAIN, EWOULDBLOCK):
+                return  # send buffer full: drop the tick, the next one supersedes it
+            print('sendmmsg unavailable, reverting to sendto. System says: %s' % error)
+            _use_sendmmsg = False
+        else:
+            return
+    for sock, packet in batch:
+        try:
+            sock.sendto(packet, addr)
+        except BlockingIOError:
+            pass  # send buffer full: drop the packet, the next tick supersedes it
+        except OSError as error:
+            print('Could not send FGMS packet to server. System says: %s' % error)
+
+
+_shared_socket = None
+
+
+def shared_socket():
+    """Return the UDP socket shared by all aircraft, opening it on first use.
+
+    One socket for the whole fleet keeps the process at a single file
+    descriptor and lets sendmmsg dispatch every tick's packets in one
+    group; the server tells the aircraft apart by callsign.
+    """
+    global _shared_socket
+    if _shared_socket is None:
+        _shared_socket = socket(AF_INET, SOCK_DGRAM)
+        _shared_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        # A large send buffer absorbs a whole-fleet burst of packets
+        # without the kernel dropping or blocking mid-tick.
+        _shared_socket.setsockopt(SOL_SOCKET, SO_SNDBUF, 1 << 20)
+        try:
+            # Forbid IP fragmentation (IP_MTU_DISCOVER = IP_PMTUDISC_DO;
+            # Linux-only values, not exported by the socket module).
+            _shared_socket.setsockopt(IPPROTO_IP, 10, 2)
+        except OSError:
+            pass
+        # Non-blocking, so a full buffer drops a position packet (the
+        # next tick supersedes it anyway) instead of stalling the loop.
+        _shared_socket.setblocking(False)
+    return _shared_socket
 
 
 class FgmsHandler:
-    """Creates sockets and starts the fgms connection for each aircraft."""
+    """Builds the fgms sender for each aircraft on the shared socket."""
 
     def __init__(self, aircraft):
         """__init__ function."""
@@ -34,27 +154,25 @@ class FgmsHandler:
         self.start()
 
     def start(self):
-        """Start FGMShandshaker."""
+        """Attach to the shared socket and build the FGMShandshaker."""
         try:
-            self.socket = socket(AF_INET, SOCK_DGRAM)
-            self.socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+            self.socket = shared_socket()
         except OSError as error:
             self.socket = None
             print('Connection error: %s' % error)
         else:
             self.FGMS_handshaker = FGMShandshaker(self.socket, self.aircraft)
-            self.fgms_handshake()
 
     def stop(self):
-        """Stop FGMShandshaker."""
-        if self.is_running():
-            self.socket = None
-            self.FGMS_handshaker.set_status(False)
+        """Stop sending; the shared socket stays open for the other aircraft."""
+        self.socket = None
 
     def is_running(self):
         """Check if socket is open."""
         return self.socket is not None
 
-    def fgms_handshake(self):
-        """Start FGMShandshaker thread."""
-        self.FGMS_handshaker.start()
+    def build_packet(self, time=None):
+        """Build one position packet, or None if the connection is closed."""
+        if self.is_running():
+            return self.FGMS_handshaker.build_packet(time)
+        return None
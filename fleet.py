@@ -0,0 +1,57 @@
+"""
+fleet.py.
+
+This module holds the collection of active Aircraft objects and provides
+bulk operations over them, so fleet-wide work is done in a single pass
+instead of being scattered across the command loop.
+"""
+
+
+class Fleet:
+    """Container for all active Aircraft objects."""
+
+    def __init__(self):
+        self.aircraft = []
+        # Maps every callsign substring to the set of matching aircraft,
+        # so command-line selection is a single dict lookup.
+        self._callsign_index = {}
+
+    def __iter__(self):
+        return iter(self.aircraft)
+
+    def __len__(self):
+        return len(self.aircraft)
+
+    def add(self, aircraft):
+        """Add an aircraft to the fleet."""
+        self.aircraft.append(aircraft)
+        self._index_callsign(aircraft)
+
+    def clear(self):
+        """Disconnect every aircraft and empty the fleet."""
+        for ac in self.aircraft:
+            ac.disconnect_aircraft()
+        self.aircraft.clear()
+        self._callsign_index.clear()
+
+    def _index_callsign(self, aircraft):
+        """Register every substring of the aircraft's callsign."""
+        callsign = aircraft.callsign
+        for i in range(len(callsign)):
+            for j in range(i + 1, len(callsign) + 1):
+                self._callsign_index.setdefault(callsign[i:j], set()).add(aircraft)
+
+    def set_paused(self, paused):
+        """Pause or unpause every aircraft."""
+        for ac in self.aircraft:
+            ac.paused = paused
+
+    def find(self, partial_callsign):
+        """Find the single aircraft whose callsign contains the given string.
+
+        Returns None if no aircraft, or more than one, matches.
+        """
+        matches = self._callsign_index.get(partial_callsign, ())
+        if len(matches) == 1:
+            return next(iter(matches))
+        return None